@@ -0,0 +1,350 @@
+# Optimisations et export statique utilisés par la cellule injectée par process_notebook.create_export_cell().
+# Le noyau importe ce module depuis la racine du dépôt ; un notebook publié rouvert ailleurs (ex. Colab)
+# s'en passe et exporte sa figure telle quelle.
+import sys
+import os
+import json
+import math
+
+from process_notebook import (
+    EXPORT_SERVER_ADDRESS_ENV, EXPORT_SERVER_AUTHKEY_ENV, EXPORT_SERVER_RESPONSE_TIMEOUT,
+    EXPORT_DOWNSAMPLE_THRESHOLD, EXPORT_DOWNSAMPLE_TARGET, EXPORT_WEBGL_THRESHOLD,
+    EXPORT_MARKER_CLUSTER_THRESHOLD, EXPORT_GEOMETRY_PIXEL_TOLERANCE, EXPORT_GEOMETRY_RESOLUTION,
+)
+
+# Résumé des optimisations, relu puis supprimé par le script de post-traitement
+EXPORT_REPORT = []
+
+
+def save_image_via_server(figure, output_path, **options):
+    """Exporte une figure Plotly via le serveur d'export partagé du batch (un seul Chromium pour tous les noyaux).
+
+    Renvoie False si aucun serveur n'est configuré ; lève RuntimeError si le serveur est indisponible,
+    ne répond pas dans EXPORT_SERVER_RESPONSE_TIMEOUT secondes ou échoue.
+    """
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
+    address = os.environ.get(EXPORT_SERVER_ADDRESS_ENV)
+    if not address:
+        return False
+    host, port = address.rsplit(":", 1)
+    try:
+        with Client((host, int(port)), authkey=bytes.fromhex(os.environ.get(EXPORT_SERVER_AUTHKEY_ENV, ""))) as conn:
+            conn.send(dict(figure=figure.to_json(), **options))
+            # Un Chromium bloqué dans le serveur ne doit pas figer le noyau (ni le batch) indéfiniment
+            if not conn.poll(EXPORT_SERVER_RESPONSE_TIMEOUT):
+                raise TimeoutError(f"aucune réponse après {EXPORT_SERVER_RESPONSE_TIMEOUT}s")
+            response = conn.recv()
+    except (OSError, EOFError, ValueError, AuthenticationError) as e:
+        raise RuntimeError(f"Serveur d'export statique indisponible ({address}) : {e}") from e
+    if not response["ok"]:
+        raise RuntimeError(f"Le serveur d'export statique a échoué : {response['error']}")
+    with open(output_path, "wb") as f:
+        f.write(response["data"])
+    return True
+
+
+def optimize_plotly_figure(figure):
+    """Allège une figure Plotly avant export : sous-échantillonnage, WebGL et simplification des GeoJSON."""
+    figure = _optimize_plotly_figure(figure)
+    _optimize_plotly_geometries(figure)
+    return figure
+
+
+def optimize_folium_map(folium_map, topojson=False):
+    """Allège une carte Folium en place avant export : clusters de marqueurs et simplification des GeoJSON."""
+    _cluster_folium_markers(folium_map)
+    _optimize_folium_geometries(folium_map, topojson)
+
+
+def save_report(output_path):
+    """Écrit le résumé des optimisations appliquées, s'il y en a."""
+    if EXPORT_REPORT:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(EXPORT_REPORT, f, ensure_ascii=False)
+
+
+def _report(message):
+    print(f"--> {message}")
+    EXPORT_REPORT.append(message)
+
+
+def _lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets : indices des points qui préservent au mieux la forme de la courbe.
+    import numpy as np
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    with np.errstate(all="ignore"):
+        for i in range(threshold - 2):
+            start = int(i * bucket_size) + 1
+            end = int((i + 1) * bucket_size) + 1
+            next_end = min(int((i + 2) * bucket_size) + 1, n)
+            avg_x = np.nanmean(x[end:next_end])
+            avg_y = np.nanmean(y[end:next_end])
+            areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            a = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+            indices[i + 1] = a
+    return indices
+
+
+def _numeric_axis(values, n):
+    # Axe x converti en flottants pour LTTB ; à défaut (catégories, x non trié), la position du point.
+    import numpy as np
+    positions = np.arange(n, dtype=float)
+    if values is None:
+        return positions
+    try:
+        array = np.asarray(values)
+        if not np.issubdtype(array.dtype, np.number):
+            import pandas as pd
+            array = pd.to_datetime(array).asi8
+        array = array.astype(float)
+    except Exception:
+        return positions
+    return array if np.all(np.diff(array) >= 0) else positions
+
+
+def _take_points(value, indices, n):
+    # Applique la sélection à tous les attributs par point (x, y, text, customdata, marker.color...).
+    import numpy as np
+    if isinstance(value, dict):
+        return {key: _take_points(item, indices, n) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)) and len(value) == n:
+        return value[indices] if isinstance(value, np.ndarray) else [value[i] for i in indices]
+    return value
+
+
+def _implicit_axis(x0, dx, indices):
+    # Positions x (x0 + dx * i) des points sélectionnés d'une trace définie par y seul ; dx en ms pour un x0 daté.
+    import numpy as np
+    if isinstance(x0, str):
+        import pandas as pd
+        return pd.to_datetime(x0) + pd.to_timedelta(np.asarray(indices) * dx, unit="ms")
+    return x0 + dx * np.asarray(indices)
+
+
+def _optimize_plotly_figure(figure):
+    # Sous-échantillonne les longues traces en lignes puis passe les gros nuages de points en WebGL.
+    import numpy as np
+    import plotly.graph_objects as go
+    traces, changed = [], False
+    points_before = points_after = 0
+    for trace in figure.data:
+        props = trace.to_plotly_json()
+        values = props.get("y") if props.get("y") is not None else props.get("x")
+        n = len(values) if values is not None and not isinstance(values, (str, dict)) else 0
+        points_before += n
+        modified = False
+        if props.get("type") in ("scatter", "scattergl") and n:
+            mode = props.get("mode") or "lines"
+            if "lines" in mode and n > EXPORT_DOWNSAMPLE_THRESHOLD:
+                try:
+                    y = np.asarray(props["y"], dtype=float)
+                    indices = _lttb_indices(_numeric_axis(props.get("x"), n), y, EXPORT_DOWNSAMPLE_TARGET)
+                    x = _implicit_axis(props.get("x0", 0), props.get("dx", 1), indices) if props.get("x") is None else None
+                    props = _take_points(props, indices, n)
+                    if x is not None:
+                        # Sans x explicite, Plotly renumérote les points conservés : on garde leurs positions d'origine
+                        props["x"] = x
+                    n, modified = len(indices), True
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"AVERTISSEMENT: Sous-échantillonnage impossible pour la trace '{props.get('name')}' : {e}", file=sys.stderr)
+            if (props["type"] == "scatter" and n > EXPORT_WEBGL_THRESHOLD
+                    and not props.get("stackgroup") and props.get("fill") in (None, "none")):
+                props["type"] = "scattergl"
+                modified = True
+        points_after += n
+        if modified:
+            trace_type = props.pop("type")
+            trace = go.Scattergl(props, skip_invalid=True) if trace_type == "scattergl" else type(trace)(props)
+            changed = True
+        traces.append(trace)
+    if not changed:
+        return figure
+    _report(f"Plotly : {points_before} -> {points_after} points, "
+            f"{sum(t.type == 'scattergl' for t in traces)} trace(s) WebGL.")
+    return go.Figure(data=traces, layout=figure.layout, frames=figure.frames)
+
+
+def _cluster_folium_markers(folium_map):
+    # Regroupe les marqueurs trop nombreux dans un MarkerCluster par couche parente.
+    import folium
+    from folium.plugins import MarkerCluster
+    # Marqueurs ponctuels seulement : Circle (rayon en mètres) et les autres sous-classes de Marker
+    # représentent des surfaces ou des symboles que le regroupement dénaturerait.
+    clusterable = (folium.Marker, folium.CircleMarker)
+    markers = {}
+    def collect(parent):
+        for name, child in list(parent._children.items()):
+            if type(child) in clusterable:
+                markers.setdefault(id(parent), (parent, []))[1].append((name, child))
+            elif not isinstance(child, MarkerCluster):
+                collect(child)
+    collect(folium_map)
+    count = sum(len(children) for _, children in markers.values())
+    if count <= EXPORT_MARKER_CLUSTER_THRESHOLD:
+        return
+    for parent, children in markers.values():
+        cluster = MarkerCluster()
+        for name, marker in children:
+            del parent._children[name]
+            cluster.add_child(marker, name=name)
+        parent.add_child(cluster)
+    _report(f"Folium : {count} marqueurs regroupés dans {len(markers)} cluster(s).")
+
+
+def _iter_geometries(data):
+    # Géométries (dictionnaires avec "coordinates") d'une FeatureCollection, Feature ou géométrie GeoJSON.
+    kind = data.get("type") if isinstance(data, dict) else None
+    if kind == "FeatureCollection":
+        for feature in data.get("features", []):
+            yield from _iter_geometries(feature)
+    elif kind == "Feature":
+        yield from _iter_geometries(data.get("geometry"))
+    elif kind == "GeometryCollection":
+        for geometry in data.get("geometries", []):
+            yield from _iter_geometries(geometry)
+    elif kind is not None and "coordinates" in data:
+        yield data
+
+
+def _iter_positions(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+    else:
+        for item in coordinates or []:
+            yield from _iter_positions(item)
+
+
+def _quantize(coordinates, decimals):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    return [_quantize(item, decimals) for item in coordinates]
+
+
+def _simplify_tolerance(geometries, zoom=None):
+    # Tolérance (en unités des coordonnées) correspondant à EXPORT_GEOMETRY_PIXEL_TOLERANCE pixels à l'écran.
+    positions = [p for g in geometries for p in _iter_positions(g["coordinates"])]
+    if not positions:
+        return None
+    xs, ys = [p[0] for p in positions], [p[1] for p in positions]
+    if zoom is not None:
+        # Web Mercator : 256 px pour 360° au zoom 0, compressés en latitude par cos(latitude)
+        units_per_pixel = 360 / (256 * 2 ** zoom) * math.cos(math.radians((min(ys) + max(ys)) / 2))
+    else:
+        units_per_pixel = max(max(xs) - min(xs), max(ys) - min(ys)) / EXPORT_GEOMETRY_RESOLUTION
+    tolerance = units_per_pixel * EXPORT_GEOMETRY_PIXEL_TOLERANCE
+    return tolerance if tolerance > 0 else None
+
+
+def _simplify_geojson(data, tolerance):
+    # Simplifie (Douglas-Peucker via shapely) puis quantifie en place les lignes et polygones.
+    try:
+        from shapely.geometry import mapping, shape
+    except ImportError:
+        shape = None
+    decimals = max(0, min(7, math.ceil(-math.log10(tolerance)) + 1))
+    for geometry in _iter_geometries(data):
+        if shape is not None and geometry["type"] not in ("Point", "MultiPoint"):
+            try:
+                simplified = shape(geometry).simplify(tolerance, preserve_topology=True)
+                if not simplified.is_empty:
+                    geometry.update(mapping(simplified))
+            except Exception:
+                pass  # Géométrie invalide : on la garde telle quelle
+        geometry["coordinates"] = _quantize(geometry["coordinates"], decimals)
+    return data
+
+
+def _folium_topojson_layer(layer, tolerance):
+    # Convertit une couche GeoJson en TopoJson (simplification topologique, frontières partagées)
+    # si elle n'utilise que des options que folium.TopoJson sait reproduire.
+    import folium
+    import topojson
+    from folium.features import GeoJsonTooltip
+    if (getattr(layer, "highlight", False) or getattr(layer, "marker", None) is not None
+            or getattr(layer, "on_each_feature", None) is not None
+            or not all(isinstance(c, (folium.Tooltip, GeoJsonTooltip)) for c in layer._children.values())):
+        return None
+    topology = json.loads(topojson.Topology(layer.data, toposimplify=tolerance, object_name="data").to_json())
+    topo_layer = folium.TopoJson(topology, "objects.data", style_function=getattr(layer, "style_function", None),
+                                 name=layer.layer_name, overlay=layer.overlay, control=layer.control,
+                                 show=layer.show, smooth_factor=layer.smooth_factor)
+    for name, child in list(layer._children.items()):
+        topo_layer.add_child(child, name=name)
+    return topo_layer
+
+
+def _report_geometry_savings(layers, bytes_before, bytes_after, topojson_layers=0):
+    saved = 100 * (1 - bytes_after / bytes_before) if bytes_before else 0
+    _report(f"Géométries : {layers} couche(s), {bytes_before / 1024:.0f} Ko -> {bytes_after / 1024:.0f} Ko "
+            f"(-{saved:.0f} %)" + (f", {topojson_layers} en TopoJSON" if topojson_layers else "") + ".")
+
+
+def _optimize_folium_geometries(folium_map, topojson):
+    # Simplifie les couches GeoJson embarquées selon le zoom initial de la carte.
+    import folium
+    layers = []
+    def collect(parent):
+        for name, child in parent._children.items():
+            if isinstance(child, folium.GeoJson) and isinstance(child.data, dict):
+                layers.append((parent, name, child))
+            collect(child)
+    collect(folium_map)
+    zoom = folium_map.options.get("zoom", folium_map.options.get("zoom_start"))
+    bytes_before = bytes_after = converted = 0
+    for parent, name, layer in layers:
+        bytes_before += len(json.dumps(layer.data))
+        tolerance = _simplify_tolerance(list(_iter_geometries(layer.data)), zoom)
+        if tolerance is None:
+            bytes_after += len(json.dumps(layer.data))
+            continue
+        topo_layer = None
+        if topojson:
+            try:
+                topo_layer = _folium_topojson_layer(layer, tolerance)
+            except Exception as e:
+                print(f"AVERTISSEMENT: Conversion TopoJSON impossible pour '{layer.layer_name}' : {e}", file=sys.stderr)
+        if topo_layer is not None:
+            parent._children[name] = topo_layer  # Même position dans l'ordre de rendu
+            topo_layer._parent = parent
+            bytes_after += len(json.dumps(topo_layer.data))
+            converted += 1
+        else:
+            bytes_after += len(json.dumps(_simplify_geojson(layer.data, tolerance)))
+    if layers:
+        _report_geometry_savings(len(layers), bytes_before, bytes_after, converted)
+
+
+def _optimize_plotly_geometries(figure):
+    # Simplifie les GeoJSON embarqués dans les traces (choroplèthes) et les couches des cartes,
+    # selon le zoom initial de leur carte (layout.mapbox.zoom, layout.map.zoom) quand il est fixé.
+    def map_zoom(subplot):
+        try:
+            return figure.layout[subplot].zoom
+        except (KeyError, AttributeError, ValueError):
+            return None  # Pas de carte tuilée (ex. choropleth sur layout.geo)
+    sources = [(trace, "geojson", map_zoom(getattr(trace, "subplot", None) or "")) for trace in figure.data
+               if isinstance(getattr(trace, "geojson", None), dict)]
+    for map_name in ("mapbox", "map"):
+        try:
+            map_layout = getattr(figure.layout, map_name)
+        except AttributeError:
+            continue
+        sources.extend((layer, "source", map_layout.zoom) for layer in map_layout.layers if isinstance(layer.source, dict))
+    bytes_before = bytes_after = 0
+    for owner, attribute, zoom in sources:
+        data = getattr(owner, attribute)
+        bytes_before += len(json.dumps(data))
+        tolerance = _simplify_tolerance(list(_iter_geometries(data)), zoom)
+        if tolerance is not None:
+            data = _simplify_geojson(data, tolerance)
+            setattr(owner, attribute, data)
+        bytes_after += len(json.dumps(data))
+    if sources:
+        _report_geometry_savings(len(sources), bytes_before, bytes_after)
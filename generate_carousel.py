@@ -1,11 +1,20 @@
 import json
 import os
 from pathlib import Path
+from urllib.parse import urlparse
 import re
+import unicodedata
 
 # --- Configuration ---
 NOTEBOOK_FOLDER = Path("./published/notebooks")
 OUTPUT_HTML_FILE = Path("./published/index.html")
+SEARCH_INDEX_FILE = Path("./published/search_index.json")
+# Libraries detected in notebooks, checked in this order
+VIZ_LIBRARIES = ("plotly", "folium", "altair", "bokeh", "matplotlib")
+# Variable holding the exported visualization (FINAL_OBJECT_VARIABLE_NAME in process_notebook.py)
+VIZ_VARIABLE_NAME = "dataviz"
+# Marker of the export cell injected by process_notebook.py
+INJECTED_CELL_MARKER = "CELLULE INJECTÉE AUTOMATIQUEMENT"
 # Automatically detect repo from git remote
 GIT_REMOTE_URL = os.popen('git config --get remote.origin.url').read().strip()
 # Extract user/repo from https://github.com/user/repo.git or git@github.com:user/repo.git
@@ -34,11 +43,104 @@ def get_notebook_title(notebook_path):
         print(f"Error reading or parsing {notebook_path}: {e}")
     return "Untitled Report" # Default title
 
+def get_notebook_search_fields(notebook_path):
+    """Extracts the searchable text of a notebook: first markdown cell, viz library and dataset hosts."""
+    description, library, hosts = "", "", set()
+    try:
+        with open(notebook_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Error reading or parsing {notebook_path}: {e}")
+        return description, library, hosts
+
+    code_sources = []
+    for cell in data.get('cells', []):
+        source = ''.join(cell.get('source', []))
+        if cell.get('cell_type') == 'markdown' and not description:
+            description = re.sub(r'<[^>]+>', ' ', source)  # Drop inline HTML styling
+        elif cell.get('cell_type') == 'code':
+            if INJECTED_CELL_MARKER in source:
+                # The export cell logs the library it detected, e.g. "--> Détecté : Plotly."
+                for output in cell.get('outputs', []):
+                    found = re.search(r'Détecté : (\w+)', ''.join(output.get('text', [])))
+                    if found:
+                        library = found.group(1).lower()
+                        break
+            else:
+                code_sources.append(source)
+
+    code = '\n'.join(code_sources)
+    if not library:
+        library = detect_viz_library(code_sources)
+    for url in re.findall(r'https?://[^\s"\'<>)\]]+', code):
+        host = urlparse(url).hostname
+        if host:
+            hosts.add(host)
+    return description, library, hosts
+
+def detect_viz_library(code_sources):
+    """Guesses the viz library of a notebook whose export cell did not log it.
+
+    Most notebooks import plotly in their setup cell whatever they draw with, so imports are only
+    the last resort: the `dataviz = <module>.` assignment comes first, then the library used in
+    the last code cells.
+    """
+    # Names bound to a viz library, e.g. {"px": "plotly", "folium": "folium", "plt": "matplotlib"}
+    aliases = {}
+    for code in code_sources:
+        for module, alias in re.findall(r'^\s*import\s+([\w.]+)(?:\s+as\s+(\w+))?', code, re.M):
+            aliases[alias or module.split('.')[0]] = module.split('.')[0]
+        for module, names in re.findall(r'^\s*from\s+([\w.]+)\s+import\s+([\w ,]+)', code, re.M):
+            for name in names.split(','):
+                if name.split():
+                    aliases[name.split()[-1]] = module.split('.')[0]
+    aliases = {alias: lib for alias, lib in aliases.items() if lib in VIZ_LIBRARIES}
+
+    assigned = re.findall(rf'^\s*{VIZ_VARIABLE_NAME}\s*=\s*(\w+)\s*[.(]', '\n'.join(code_sources), re.M)
+    if assigned and assigned[-1] in aliases:
+        return aliases[assigned[-1]]
+
+    for code in reversed(code_sources):
+        code = re.sub(r'^\s*(?:import|from)\s.*$', '', code, flags=re.M)
+        # Library used last in the cell: the visualization is usually built at the end
+        uses = [(found.start(), aliases[found.group(1)])
+                for found in re.finditer(r'\b(\w+)\s*[.(]', code) if found.group(1) in aliases]
+        if uses:
+            return max(uses)[1]
+
+    code = '\n'.join(code_sources)
+    return next((lib for lib in VIZ_LIBRARIES if re.search(rf'\b{lib}\b', code)), "")
+
+def tokenize(text):
+    """Lowercases, strips accents and splits text into alphanumeric search tokens."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [token for token in re.findall(r'[a-z0-9]+', text) if len(token) > 1]
+
+def build_search_index(documents):
+    """Builds a compact inverted index from a list of per-item search texts.
+
+    Tokens are sorted so the page can resolve prefixes with a binary search, and
+    each posting list is delta-encoded item ids.
+    """
+    postings = {}
+    for item_id, text in enumerate(documents):
+        for token in set(tokenize(text)):
+            postings.setdefault(token, []).append(item_id)
+
+    tokens = sorted(postings)
+    encoded = []
+    for token in tokens:
+        ids = postings[token]
+        encoded.append([ids[0]] + [b - a for a, b in zip(ids, ids[1:])])
+    return {"version": 1, "count": len(documents), "tokens": tokens, "postings": encoded}
+
 def generate_html_gallery():
     """Generates the HTML file with the notebook gallery."""
     notebooks = sorted(NOTEBOOK_FOLDER.glob('*.ipynb'))
     
     items_html = ""
+    search_documents = []
     for notebook_path in notebooks:
         thumbnail_path = notebook_path.with_suffix('.png')
         if not thumbnail_path.exists():
@@ -46,6 +148,9 @@ def generate_html_gallery():
             continue
 
         title = get_notebook_title(notebook_path)
+        description, library, hosts = get_notebook_search_fields(notebook_path)
+        search_id = len(search_documents)
+        search_documents.append(' '.join([title, description, library, *sorted(hosts)]))
         colab_url = f"https://colab.research.google.com/github/{GITHUB_REPO}/blob/main/{notebook_path}"
         
         # Paths should be relative to the output HTML file's location (the 'published' directory)
@@ -62,7 +167,7 @@ def generate_html_gallery():
             click_action = f"openImageModal('{simple_thumbnail_path}')"
 
         items_html += f"""
-        <div class="gallery-item" onclick="{click_action}" title="{title}">
+        <div class="gallery-item" data-search-id="{search_id}" onclick="{click_action}" title="{title}">
             <img src="{simple_thumbnail_path}" alt="{title}" loading="lazy">
             <div class="title-overlay">
                 <div class="overlay-content">
@@ -77,6 +182,9 @@ def generate_html_gallery():
         </div>
         """
 
+    # The search index is fetched relative to the output HTML file
+    search_index_url = SEARCH_INDEX_FILE.relative_to(OUTPUT_HTML_FILE.parent).as_posix()
+
     html_content = f"""
 <!DOCTYPE html>
 <html lang="en">
@@ -106,6 +214,24 @@ def generate_html_gallery():
             text-align: center;
             margin-bottom: 40px;
         }}
+        .search-input {{
+            width: min(600px, 100%);
+            padding: 12px 18px;
+            font-size: 1rem;
+            color: #f0f0f0;
+            background-color: #2c2c2c;
+            border: 1px solid #444;
+            border-radius: 24px;
+            outline: none;
+        }}
+        .search-input:focus {{
+            border-color: #888;
+        }}
+        .search-count {{
+            margin-top: 10px;
+            font-size: 0.9rem;
+            color: #888;
+        }}
         .gallery {{
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
@@ -228,6 +354,10 @@ def generate_html_gallery():
 <body>
     <div class="container">
         <h1>Made with ❤️ and with duckit</h1>
+        <div class="controls">
+            <input type="search" id="search-input" class="search-input" placeholder="Search by title, description, library or data source..." autocomplete="off">
+            <div id="search-count" class="search-count"></div>
+        </div>
         <div class="gallery">{items_html}</div>
         <div class="footer">
              <p>
@@ -280,11 +410,91 @@ def generate_html_gallery():
                 closeHtmlModal();
             }}
         }});
+
+        // --- Search: prebuilt inverted index, loaded on first use ---
+        const galleryItems = Array.from(document.querySelectorAll('.gallery-item'));
+        const searchInput = document.getElementById('search-input');
+        const searchCount = document.getElementById('search-count');
+        let searchIndex = null;
+        let searchIndexPromise = null;
+
+        function loadSearchIndex() {{
+            if (!searchIndexPromise) {{
+                searchIndexPromise = fetch('{search_index_url}')
+                    .then(response => {{
+                        if (!response.ok) throw new Error(`HTTP ${{response.status}}`);
+                        return response.json();
+                    }})
+                    .then(data => {{
+                        // Posting lists are delta-encoded
+                        const postings = data.postings.map(deltas => {{
+                            let id = 0;
+                            return deltas.map(delta => (id += delta));
+                        }});
+                        searchIndex = {{ tokens: data.tokens, postings: postings }};
+                        return true;
+                    }})
+                    .catch(error => {{
+                        // Forget the failed attempt so the next keystroke retries
+                        searchIndexPromise = null;
+                        searchCount.textContent = `Search unavailable: could not load the index (${{error.message}}).`;
+                        return false;
+                    }});
+            }}
+            return searchIndexPromise;
+        }}
+
+        function normalizeQuery(text) {{
+            return text.toLowerCase().normalize('NFKD').replace(/[\\u0300-\\u036f]/g, '');
+        }}
+
+        function matchPrefix(prefix) {{
+            const tokens = searchIndex.tokens;
+            let low = 0, high = tokens.length;
+            while (low < high) {{
+                const mid = (low + high) >> 1;
+                if (tokens[mid] < prefix) low = mid + 1; else high = mid;
+            }}
+            const ids = new Set();
+            for (let i = low; i < tokens.length && tokens[i].startsWith(prefix); i++) {{
+                for (const id of searchIndex.postings[i]) ids.add(id);
+            }}
+            return ids;
+        }}
+
+        function filterGallery() {{
+            const terms = normalizeQuery(searchInput.value).match(/[a-z0-9]+/g);
+            let matches = null;
+            if (terms && searchIndex) {{
+                for (const term of terms) {{
+                    const ids = matchPrefix(term);
+                    matches = matches === null ? ids : new Set([...matches].filter(id => ids.has(id)));
+                    if (matches.size === 0) break;
+                }}
+            }}
+            let visible = 0;
+            for (const item of galleryItems) {{
+                const show = matches === null || matches.has(Number(item.dataset.searchId));
+                if (item.hidden === show) item.hidden = !show;
+                if (show) visible++;
+            }}
+            searchCount.textContent = matches === null ? '' : `${{visible}} / ${{galleryItems.length}}`;
+        }}
+
+        searchInput.addEventListener('focus', loadSearchIndex, {{ once: true }});
+        searchInput.addEventListener('input', () => {{
+            if (searchIndex) filterGallery();
+            else loadSearchIndex().then(loaded => {{ if (loaded) filterGallery(); }});
+        }});
     </script>
 </body>
 </html>
 """.replace("{{", "{{").replace("}}", "}}").replace('{items_html}', items_html)
 
+    with open(SEARCH_INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump(build_search_index(search_documents), f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Search index with {len(search_documents)} item(s) written to: {SEARCH_INDEX_FILE}")
+
     with open(OUTPUT_HTML_FILE, 'w', encoding='utf-8') as f:
         f.write(html_content)
     print(f"Successfully generated gallery at: {OUTPUT_HTML_FILE}")
@@ -1,18 +1,264 @@
 import sys
+import os
+import re
+import ast
+import io
 import json
+import math
+import base64
+import heapq
+import hashlib
+import argparse
+import statistics
+import multiprocessing
 import subprocess
 import time
 import textwrap
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # --- Configuration ---
 FINAL_OBJECT_VARIABLE_NAME = "dataviz"
 ROOT_NOTEBOOK_FOLDER = Path("./notebooks")
 PUBLISHED_NOTEBOOK_FOLDER = Path("./published/notebooks")
+# Capture d'écran : budget maximal de pixels de l'image finale, et côté maximal d'une tuile
+# (limite de texture du navigateur ; au-delà, la capture est découpée puis assemblée).
+SCREENSHOT_MAX_PIXELS = 12_000_000
+SCREENSHOT_TILE_SIZE = 4096
+# Élément à capturer selon la bibliothèque détectée (à défaut, toute la page).
+VIZ_CAPTURE_SELECTORS = {
+    "plotly": ".plotly-graph-div",
+    "folium": ".folium-map",
+    "altair": ".vega-embed canvas, .vega-embed svg.marks",
+    # Bokeh 3 : racine en "display: contents", on mesure l'élément qu'elle contient ; .bk-root pour Bokeh 2.
+    "bokeh": "[data-root-id] > *, .bk-root",
+}
+# Serveur d'export statique partagé (Plotly -> PNG/SVG) : les noyaux le trouvent via ces variables d'environnement.
+EXPORT_SERVER_ADDRESS_ENV = "BATCHBOOKS_EXPORT_SERVER"
+EXPORT_SERVER_AUTHKEY_ENV = "BATCHBOOKS_EXPORT_AUTHKEY"
+EXPORT_SERVER_STARTUP_TIMEOUT = 60  # secondes, démarrage de Chromium compris
+EXPORT_SERVER_REQUEST_TIMEOUT = 30  # secondes d'attente de la requête d'un noyau connecté
+EXPORT_SERVER_RESPONSE_TIMEOUT = 120  # secondes d'attente de l'image côté noyau, file d'attente du rendu comprise
+# Cache par cellule (option --cell-cache) : sorties et objets déclarés dans les métadonnées des cellules,
+# ex. {"batchbooks": {"cache": {"tables": ["loaded_dataset"], "dataframes": ["df"]}}}.
+CELL_CACHE_FOLDER = Path("./.cell_cache")
+CELL_CACHE_MAX_BYTES = 2 * 1024 ** 3
+NOTEBOOK_METADATA_KEY = "batchbooks"
+# Ordonnancement du batch : historique des durées d'exécution, durée supposée d'un notebook inconnu,
+# et nombre de notebooks exécutés en parallèle (option --workers).
+RUNTIME_HISTORY_FILE = Path("./.batch_runtimes.json")
+DEFAULT_NOTEBOOK_RUNTIME = 60.0  # secondes
+BATCH_WORKERS = 1
+# Allègement des figures avant export (désactivable par notebook : {"batchbooks": {"optimize_export": false}}).
+EXPORT_DOWNSAMPLE_THRESHOLD = 5000   # points au-delà desquels une trace Plotly en lignes est sous-échantillonnée (LTTB)
+EXPORT_DOWNSAMPLE_TARGET = 2000      # points conservés par trace sous-échantillonnée
+EXPORT_WEBGL_THRESHOLD = 5000        # points au-delà desquels une trace scatter passe en scattergl
+EXPORT_MARKER_CLUSTER_THRESHOLD = 500  # marqueurs Folium au-delà desquels ils sont regroupés en clusters
+EXPORT_GEOMETRY_PIXEL_TOLERANCE = 0.5  # écart maximal toléré à l'écran (en pixels) lors de la simplification GeoJSON
+EXPORT_GEOMETRY_RESOLUTION = 1200      # largeur de rendu supposée (px) quand le niveau de zoom est inconnu
+
+
+class ExportServerError(RuntimeError):
+    """Le serveur d'export statique est indisponible."""
+
+
+def _run_export_server(authkey, ready_conn):
+    """Boucle du processus d'export : un seul Chromium (kaleido) sert tous les noyaux du batch."""
+    from multiprocessing.connection import Client, Listener
+    try:
+        import plotly.io as pio
+        try:
+            # kaleido >= 1.0 relance un navigateur à chaque export, sauf si un serveur synchrone est démarré.
+            import kaleido
+            if hasattr(kaleido, "start_sync_server"):
+                kaleido.start_sync_server()
+        except ImportError:
+            pass
+        # Premier rendu à blanc : le coût de démarrage de Chromium est payé ici, une seule fois.
+        pio.to_image({"data": [], "layout": {}}, format="png", width=10, height=10)
+    except Exception as e:
+        ready_conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        return
+
+    # Le rendu reste sérialisé (un seul Chromium), mais chaque connexion a son thread :
+    # un noyau lent ou bloqué n'empêche pas les autres d'envoyer leur requête.
+    render_lock = threading.Lock()
+    stopping = threading.Event()
+
+    def serve(conn, listener_address):
+        with conn:
+            try:
+                if not conn.poll(EXPORT_SERVER_REQUEST_TIMEOUT):
+                    return  # Aucune requête reçue à temps
+                request = conn.recv()
+                if request.get("command") == "shutdown":
+                    stopping.set()
+                    conn.send({"ok": True})
+                    # Réveille la boucle bloquée dans accept() pour qu'elle constate l'arrêt
+                    Client(listener_address, authkey=authkey).close()
+                    return
+                figure = pio.from_json(request["figure"])
+                with render_lock:
+                    data = pio.to_image(figure, format=request.get("format", "png"),
+                                        width=request.get("width"), height=request.get("height"),
+                                        scale=request.get("scale"))
+                conn.send({"ok": True, "data": data})
+            except (OSError, EOFError):
+                pass  # Le noyau client a fermé la connexion
+            except Exception as e:
+                try:
+                    conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+                except (OSError, EOFError):
+                    pass
+
+    with Listener(("127.0.0.1", 0), backlog=16, authkey=authkey) as listener:
+        ready_conn.send({"ok": True, "address": listener.address})
+        ready_conn.close()
+        while not stopping.is_set():
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                continue
+            if stopping.is_set():
+                conn.close()
+                break
+            threading.Thread(target=serve, args=(conn, listener.address), daemon=True).start()
+
+
+class ExportServer:
+    """Processus d'export statique à longue durée de vie, partagé par les noyaux d'un batch.
+
+    Les noyaux lancés entre start() et stop() lui envoient le JSON de leur figure Plotly
+    par socket locale et reçoivent les octets PNG/SVG, au lieu de démarrer chacun Chromium.
+    """
+
+    def __init__(self):
+        self.address = None
+        self._authkey = os.urandom(32)
+        self._process = None
+
+    def start(self):
+        print("--> Démarrage du serveur d'export statique partagé...")
+        ctx = multiprocessing.get_context("spawn")
+        ready_reader, ready_writer = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(target=_run_export_server, args=(self._authkey, ready_writer), daemon=True)
+        self._process.start()
+        ready_writer.close()
+
+        try:
+            if not ready_reader.poll(EXPORT_SERVER_STARTUP_TIMEOUT):
+                raise ExportServerError(f"Le serveur d'export n'a pas démarré en {EXPORT_SERVER_STARTUP_TIMEOUT}s.")
+            status = ready_reader.recv()
+        except EOFError:
+            status = {"ok": False, "error": "le processus s'est arrêté pendant le démarrage"}
+        except ExportServerError:
+            self.stop()
+            raise
+        finally:
+            ready_reader.close()
+        if not status["ok"]:
+            self.stop()
+            raise ExportServerError(f"Le serveur d'export n'a pas pu démarrer : {status['error']}")
+
+        host, port = self.address = status["address"]
+        os.environ[EXPORT_SERVER_ADDRESS_ENV] = f"{host}:{port}"
+        os.environ[EXPORT_SERVER_AUTHKEY_ENV] = self._authkey.hex()
+        print(f"--> Serveur d'export prêt sur {host}:{port}.")
+        return self
+
+    def stop(self):
+        os.environ.pop(EXPORT_SERVER_ADDRESS_ENV, None)
+        os.environ.pop(EXPORT_SERVER_AUTHKEY_ENV, None)
+        if self._process is None:
+            return
+        if self.address and self._process.is_alive():
+            from multiprocessing.connection import Client
+            try:
+                with Client(self.address, authkey=self._authkey) as conn:
+                    conn.send({"command": "shutdown"})
+                    conn.recv()
+            except (OSError, EOFError):
+                pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+        self.address = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _measure_capture_region(driver, selector):
+    """Renvoie la zone (coordonnées de la page) de l'élément de visualisation, ou de toute la page à défaut."""
+    region = driver.execute_script("""
+        const element = arguments[0] ? document.querySelector(arguments[0]) : null;
+        const rect = element ? element.getBoundingClientRect() : null;
+        if (rect && rect.width > 0 && rect.height > 0) {
+            return {found: true, x: rect.left + window.scrollX, y: rect.top + window.scrollY,
+                    width: rect.width, height: rect.height};
+        }
+        return {found: false, x: 0, y: 0,
+                width: document.body.scrollWidth, height: document.body.scrollHeight};
+    """, selector)
+    if region['found']:
+        print(f"--> Élément '{selector}' détecté : {region['width']:.0f}x{region['height']:.0f}.")
+    else:
+        print("--> Aucun élément de visualisation isolé, capture de la page entière.")
+    return region
+
+
+def _capture_region(driver, region, scale, output_png_path):
+    """Capture une zone de la page via Chrome DevTools, en tuiles assemblées si elle dépasse SCREENSHOT_TILE_SIZE.
+
+    Renvoie le nombre de tuiles capturées.
+    """
+    tile_span = SCREENSHOT_TILE_SIZE / scale  # Côté d'une tuile en pixels CSS
+    tiles = []
+    y = 0.0
+    while y < region['height']:
+        x = 0.0
+        while x < region['width']:
+            clip = {
+                "x": region['x'] + x, "y": region['y'] + y,
+                "width": min(tile_span, region['width'] - x),
+                "height": min(tile_span, region['height'] - y),
+                "scale": scale,
+            }
+            result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+                "format": "png", "clip": clip, "captureBeyondViewport": True,
+            })
+            tiles.append((x, y, base64.b64decode(result['data'])))
+            x += tile_span
+        y += tile_span
+
+    if len(tiles) == 1:
+        with open(output_png_path, 'wb') as f:
+            f.write(tiles[0][2])
+        return 1
+
+    print(f"--> Assemblage de {len(tiles)} tuiles...")
+    from PIL import Image
+    canvas = Image.new("RGB", (round(region['width'] * scale), round(region['height'] * scale)), "white")
+    for x, y, data in tiles:
+        with Image.open(io.BytesIO(data)) as tile:
+            canvas.paste(tile.convert("RGB"), (round(x * scale), round(y * scale)))
+    canvas.save(output_png_path)
+    return len(tiles)
+
 
 def capture_html_screenshot(html_path, output_png_path):
-    """Prend une capture d'écran adaptative d'un fichier HTML local avec Selenium."""
+    """Prend une capture d'écran adaptative d'un fichier HTML local avec Selenium.
+
+    La capture est limitée à l'élément de visualisation détecté (voir VIZ_CAPTURE_SELECTORS),
+    réduite si elle dépasse SCREENSHOT_MAX_PIXELS et découpée en tuiles au-delà de SCREENSHOT_TILE_SIZE.
+    """
+    start_time = time.perf_counter()
     print("--> Initialisation du navigateur headless pour la capture HTML...")
     try:
         from selenium import webdriver
@@ -51,20 +297,25 @@ def capture_html_screenshot(html_path, output_png_path):
         print("--> Attente du chargement du contenu interactif...")
         wait = WebDriverWait(driver, 20) # Timeout augmenté à 20 secondes
 
+        lib_name = None
         try:
             with open(html_path, 'r', encoding='utf-8') as f:
                 header = f.read(4096)
 
             if 'plotly' in header:
+                lib_name = "plotly"
                 print("--> Détecté : Plotly. Attente du conteneur du graphique.")
                 wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".svg-container, .main-svg, .plotly-graph-div")))
             elif 'folium' in header or 'leaflet' in header:
+                lib_name = "folium"
                 print("--> Détecté : Folium/Leaflet. Attente des tuiles de la carte.")
                 wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, "leaflet-tile-loaded")))
             elif 'altair' in header or 'vega' in header:
+                lib_name = "altair"
                 print("--> Détecté : Altair/Vega. Attente du canvas.")
                 wait.until(EC.presence_of_element_located((By.TAG_NAME, "canvas")))
             elif 'bokeh' in header:
+                lib_name = "bokeh"
                 print("--> Détecté : Bokeh. Attente du canvas.")
                 wait.until(EC.presence_of_element_located((By.CLASS_NAME, "bk-canvas")))
             else:
@@ -86,9 +337,11 @@ def capture_html_screenshot(html_path, output_png_path):
                     height: document.body.scrollHeight
                 }
             """)
-            width = size['width'] + 20  # Ajout d'une petite marge
-            height = size['height'] + 20
-            
+            # Au-delà de la taille d'une tuile, agrandir la fenêtre n'apporte rien :
+            # la capture se fait hors viewport (captureBeyondViewport).
+            width = min(size['width'] + 20, SCREENSHOT_TILE_SIZE)  # Ajout d'une petite marge
+            height = min(size['height'] + 20, SCREENSHOT_TILE_SIZE)
+
             print(f"--> Contenu détecté : {size['width']}x{size['height']}. Redimensionnement à {width}x{height}.")
             driver.set_window_size(width, height)
             time.sleep(0.5) # Laisse le temps au navigateur de redessiner
@@ -97,8 +350,25 @@ def capture_html_screenshot(html_path, output_png_path):
             print(f"AVERTISSEMENT: Impossible d'ajuster la taille dynamiquement. Utilisation de 1600x1200. Erreur: {e}", file=sys.stderr)
             driver.set_window_size(1600, 1200)
 
-        driver.save_screenshot(output_png_path)
+        capture_start = time.perf_counter()
+        try:
+            region = _measure_capture_region(driver, VIZ_CAPTURE_SELECTORS.get(lib_name))
+            scale = min(1.0, math.sqrt(SCREENSHOT_MAX_PIXELS / (region['width'] * region['height'])))
+            if scale < 1.0:
+                print(f"--> Zone de {region['width']:.0f}x{region['height']:.0f} au-delà du budget de {SCREENSHOT_MAX_PIXELS} pixels. Échelle réduite à {scale:.2f}.")
+            tile_count = _capture_region(driver, region, scale, output_png_path)
+            capture_size = (round(region['width'] * scale), round(region['height'] * scale))
+        except Exception as e:
+            print(f"AVERTISSEMENT: La capture ciblée a échoué, capture de la fenêtre entière. Erreur: {e}", file=sys.stderr)
+            driver.save_screenshot(output_png_path)
+            tile_count = 1
+            capture_size = tuple(driver.get_window_size().values())
+
+        capture_time = time.perf_counter() - capture_start
+        output_size = os.path.getsize(output_png_path)
         print(f"--> Capture d'écran sauvegardée dans : {output_png_path}")
+        print(f"--> {capture_size[0]}x{capture_size[1]} px, {tile_count} tuile(s), {output_size / 1024:.0f} Ko "
+              f"en {capture_time:.2f}s (total {time.perf_counter() - start_time:.2f}s).")
 
     except WebDriverException as e:
         print(f"ERREUR WebDriver: {e}", file=sys.stderr)
@@ -141,8 +411,14 @@ def center_html_content(html_path):
         print(f"AVERTISSEMENT: N'a pas pu ajuster le CSS. Erreur: {e}", file=sys.stderr)
 
 
-def create_export_cell(output_image_name, output_html_name):
-    """Crée le code source pour la cellule d'exportation de manière robuste."""
+def create_export_cell(output_image_name, output_html_name, optimize_export=True, topojson=False):
+    """Crée le code source pour la cellule d'exportation de manière robuste.
+
+    Avec optimize_export, les figures trop lourdes sont allégées avant l'export (voir EXPORT_*_THRESHOLD)
+    et les couches GeoJSON sont simplifiées et quantifiées ; avec topojson, les couches Folium
+    compatibles sont converties en TopoJSON. Ces optimisations et le client du serveur d'export sont
+    dans export_helpers.py, que la cellule importe pour rester courte dans les notebooks publiés.
+    """
     # On injecte les variables au début du code de la cellule.
     # On utilise repr() pour s'assurer que les chaînes sont correctement échappées.
     injected_variables = f"""
@@ -150,6 +426,8 @@ def create_export_cell(output_image_name, output_html_name):
 FINAL_OBJECT_VARIABLE_NAME = {repr(FINAL_OBJECT_VARIABLE_NAME)}
 OUTPUT_IMAGE_NAME = {repr(output_image_name)}
 OUTPUT_HTML_NAME = {repr(output_html_name)}
+OPTIMIZE_EXPORT = {repr(optimize_export)}
+TOPOJSON_EXPORT = {repr(topojson)}
 """
 
     # La logique d'exportation est une chaîne de caractères brute.
@@ -165,6 +443,12 @@ try:
     from bokeh.io import save as bokeh_save
 except ImportError:
     bokeh_save = None
+# Optimisations et serveur d'export partagé (export_helpers.py, à la racine du dépôt)
+sys.path.append(os.getcwd())
+try:
+    import export_helpers
+except ImportError:
+    export_helpers = None  # Notebook rouvert hors du dépôt (ex. Colab) : export sans optimisation
 
 try:
     # On s'assure que le dossier de sortie existe
@@ -185,13 +469,22 @@ try:
 
     if 'plotly.graph_objs._figure.Figure' in object_type:
         print(f"--> Détecté : Plotly. Sauvegarde HTML et PNG.")
+        if OPTIMIZE_EXPORT and export_helpers is not None:
+            try:
+                final_object = export_helpers.optimize_plotly_figure(final_object)
+            except Exception as e:
+                print(f"AVERTISSEMENT: Optimisation de la figure ignorée. Erreur: {e}", file=sys.stderr)
         # 1. Sauvegarde HTML pour l'interactivité
         print(f"--> Sauvegarde HTML dans : {OUTPUT_HTML_NAME}")
         final_object.write_html(OUTPUT_HTML_NAME, include_plotlyjs='cdn')
         # 2. Sauvegarde PNG pour l'aperçu statique
         try:
-            print(f"--> Tentative de sauvegarde PNG directe dans : {OUTPUT_IMAGE_NAME}")
-            final_object.write_image(OUTPUT_IMAGE_NAME, scale=3, width=1200, height=800)
+            if export_helpers is not None and export_helpers.save_image_via_server(
+                    final_object, OUTPUT_IMAGE_NAME, format="png", scale=3, width=1200, height=800):
+                print(f"--> PNG sauvegardé via le serveur d'export partagé dans : {OUTPUT_IMAGE_NAME}")
+            else:
+                print(f"--> Tentative de sauvegarde PNG directe dans : {OUTPUT_IMAGE_NAME}")
+                final_object.write_image(OUTPUT_IMAGE_NAME, scale=3, width=1200, height=800)
             print(f"--> Image Plotly sauvegardée avec succès.")
         except Exception as e:
             print(f"AVERTISSEMENT: La sauvegarde directe en PNG a échoué (kaleido est-il installé?).", file=sys.stderr)
@@ -202,6 +495,11 @@ try:
                 f.write("plotly")
     elif 'folium.folium.Map' in object_type:
         print(f"--> Détecté : Folium. Sauvegarde HTML dans : {OUTPUT_HTML_NAME}")
+        if OPTIMIZE_EXPORT and export_helpers is not None:
+            try:
+                export_helpers.optimize_folium_map(final_object, topojson=TOPOJSON_EXPORT)
+            except Exception as e:
+                print(f"AVERTISSEMENT: Optimisation de la carte ignorée. Erreur: {e}", file=sys.stderr)
         final_object.save(OUTPUT_HTML_NAME)
         # On crée un fichier marqueur générique pour la capture d'écran
         print(f"--> Création du marqueur de capture d'écran.")
@@ -230,6 +528,9 @@ except NameError:
     print(f"AVERTISSEMENT: Aucune variable '{FINAL_OBJECT_VARIABLE_NAME}' trouvée.", file=sys.stderr)
 except Exception as e:
     print(f"ERREUR lors de l'exportation : {e}", file=sys.stderr)
+
+if export_helpers is not None:
+    export_helpers.save_report(f"{OUTPUT_HTML_NAME}.export_report.json")
 """
     export_code = textwrap.dedent(injected_variables) + textwrap.dedent(export_logic)
 
@@ -238,8 +539,210 @@ except Exception as e:
         "source": export_code.splitlines(True)
     }
 
-def process_notebook(notebook_path_str):
-    """Modifie, exécute, et déplace un notebook du répertoire racine vers le dossier de publication."""
+def _is_export_cell(cell):
+    """Indique si une cellule est une cellule d'export injectée par create_export_cell()."""
+    source = cell.get('source', '')
+    source = source if isinstance(source, str) else ''.join(source)
+    return cell.get('cell_type') == 'code' and "# --- Variables injectées par le script ---" in source
+
+
+def _cell_cache_declaration(cell):
+    """Renvoie les DataFrames et tables DuckDB qu'une cellule déclare cacheables, ou None."""
+    declared = cell.get('metadata', {}).get(NOTEBOOK_METADATA_KEY, {}).get('cache')
+    if not declared:
+        return None
+    return {"dataframes": list(declared.get("dataframes", [])), "tables": list(declared.get("tables", []))}
+
+
+def _cell_cache_keys(cells):
+    """Calcule une clé par cellule : hash chaîné de sa source et de celles de toutes les cellules de code en amont."""
+    digest = hashlib.sha256()
+    keys = []
+    for cell in cells:
+        if cell['cell_type'] == 'code':
+            source = cell['source'] if isinstance(cell['source'], str) else ''.join(cell['source'])
+            digest.update(source.encode('utf-8'))
+            digest.update(json.dumps(_cell_cache_declaration(cell), sort_keys=True).encode('utf-8'))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def _sql_path(path):
+    return str(Path(path).resolve()).replace("'", "''")
+
+
+def _cell_cache_save_code(declaration, entry_path):
+    """Code exécuté dans le noyau pour écrire en Parquet les objets déclarés par une cellule."""
+    lines = ["import duckdb as _batchbooks_duckdb"]
+    for name in declaration["dataframes"]:
+        lines.append(f"{name}.to_parquet({repr(str((entry_path / f'df_{name}.parquet').resolve()))})")
+    for name in declaration["tables"]:
+        lines.append(f"_batchbooks_duckdb.execute(\"COPY {name} TO '{_sql_path(entry_path / f'table_{name}.parquet')}' (FORMAT PARQUET)\")")
+    return "\n".join(lines)
+
+
+def _cell_cache_restore_code(declaration, entry_path):
+    """Code exécuté dans le noyau pour recharger depuis Parquet les objets déclarés par une cellule."""
+    lines = ["import duckdb as _batchbooks_duckdb", "import pandas as _batchbooks_pd"]
+    for name in declaration["dataframes"]:
+        lines.append(f"{name} = _batchbooks_pd.read_parquet({repr(str((entry_path / f'df_{name}.parquet').resolve()))})")
+    for name in declaration["tables"]:
+        lines.append(f"_batchbooks_duckdb.execute(\"CREATE OR REPLACE TABLE {name} AS "
+                     f"SELECT * FROM read_parquet('{_sql_path(entry_path / f'table_{name}.parquet')}')\")")
+    return "\n".join(lines)
+
+
+# INSTALL/LOAD d'extensions DuckDB (ddb.execute("load spatial"), "INSTALL h3 FROM community"...)
+_DUCKDB_EXTENSION_STATEMENT = re.compile(r"^\s*(?:force\s+)?(?:install|load)\s+\w+", re.IGNORECASE)
+
+
+def _cell_cache_replay_code(cell):
+    """Code exécuté dans le noyau pour rejouer ce qu'une cellule restaurée définit en plus de ses objets déclarés.
+
+    Ce sont ses imports, fonctions et classes de premier niveau (ex. load_file_from_url_lite, run_query)
+    et les chargements d'extensions DuckDB qu'elle contient, y compris dans ses fonctions.
+    Lève SyntaxError si la source n'est pas analysable.
+    """
+    source = cell['source'] if isinstance(cell['source'], str) else ''.join(cell['source'])
+    # Les commandes magiques (%pip, !pip...) ne sont pas du Python : on les blanchit sans décaler les lignes
+    lines = ["" if line.lstrip().startswith(("%", "!")) else line for line in source.splitlines()]
+    source = "\n".join(lines)
+    tree = ast.parse(source)
+    statements = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first_line = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+            statements.append("\n".join(lines[first_line - 1:node.end_lineno]))
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ("execute", "sql")
+                and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+                and _DUCKDB_EXTENSION_STATEMENT.match(node.args[0].value)):
+            statements.append(ast.get_source_segment(source, node))
+    return "\n".join(statements)
+
+
+# Plusieurs workers (--workers) partagent CELL_CACHE_FOLDER : l'éviction est sérialisée.
+_CELL_CACHE_LOCK = threading.Lock()
+
+
+def _evict_cell_cache():
+    """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous CELL_CACHE_MAX_BYTES."""
+    with _CELL_CACHE_LOCK:
+        if not CELL_CACHE_FOLDER.exists():
+            return
+        entries = {}
+        for entry in CELL_CACHE_FOLDER.iterdir():
+            # Les dossiers .tmp sont des écritures en cours d'autres workers
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                if entry.is_dir():
+                    size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+                    entries[entry] = (entry.stat().st_mtime, size)
+            except FileNotFoundError:
+                continue  # Entrée remplacée ou supprimée pendant le parcours
+        total = sum(size for _, size in entries.values())
+        for entry, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if total <= CELL_CACHE_MAX_BYTES:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            print(f"--> Cache : entrée {entry.name[:12]} évincée ({size / 1024 ** 2:.1f} Mo).")
+
+
+class NotebookExecutionError(RuntimeError):
+    """L'exécution d'un notebook par nbclient a échoué (noyau introuvable ou arrêté, etc.)."""
+
+
+def execute_with_cell_cache(notebook_path):
+    """Exécute un notebook en place en réutilisant le cache des cellules inchangées.
+
+    Les cellules qui déclarent des objets cacheables et dont la source (et l'amont) n'a pas changé
+    ne sont pas réexécutées : leurs sorties sont restaurées, leurs objets rechargés depuis Parquet, et leurs
+    imports, fonctions et extensions DuckDB rejoués (voir _cell_cache_replay_code).
+    Dès la première cellule déclarée absente du cache, l'exécution reprend normalement.
+    Lève NotebookExecutionError si l'exécution elle-même échoue.
+    """
+    try:
+        restored, executed = _run_cells_with_cache(notebook_path)
+    except Exception as e:
+        raise NotebookExecutionError(f"{type(e).__name__}: {e}") from e
+    print(f"--> Cache de cellules : {restored} cellule(s) restaurée(s), {executed} exécutée(s).")
+    _evict_cell_cache()
+
+
+def _run_cells_with_cache(notebook_path):
+    import nbformat
+    from nbclient import NotebookClient
+
+    notebook_path = Path(notebook_path)
+    nb = nbformat.read(notebook_path, as_version=4)
+    client = NotebookClient(nb, allow_errors=True,
+                            resources={"metadata": {"path": str(notebook_path.parent.resolve())}})
+    keys = _cell_cache_keys(nb.cells)
+    CELL_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+
+    def run_helper(code, index):
+        cell = nb.cells[index]
+        helper = client.execute_cell(nbformat.v4.new_code_cell(code), index, store_history=False)
+        nb.cells[index] = cell  # execute_cell() remplace la cellule du notebook par celle exécutée
+        errors = [o for o in helper.outputs if o.output_type == 'error']
+        if errors:
+            raise RuntimeError(f"{errors[0].ename}: {errors[0].evalue}")
+
+    restored, executed = 0, 0
+    replaying = True
+    with client.setup_kernel():
+        for index, cell in enumerate(nb.cells):
+            if cell.cell_type != 'code':
+                continue
+            declaration = _cell_cache_declaration(cell)
+            entry_path = CELL_CACHE_FOLDER / keys[index]
+
+            if replaying and declaration and (entry_path / "outputs.json").exists():
+                try:
+                    # Définitions et extensions d'abord : les tables restaurées peuvent en dépendre (ex. GEOMETRY)
+                    run_helper(_cell_cache_replay_code(cell) + "\n" + _cell_cache_restore_code(declaration, entry_path), index)
+                    with open(entry_path / "outputs.json", 'r', encoding='utf-8') as f:
+                        cell.outputs = [nbformat.from_dict(o) for o in json.load(f)]
+                    cell.execution_count = None
+                    os.utime(entry_path)  # Marque l'entrée comme récemment utilisée
+                    restored += 1
+                    continue
+                except Exception as e:
+                    print(f"AVERTISSEMENT: Restauration du cache impossible pour la cellule {index}, réexécution. Erreur: {e}", file=sys.stderr)
+            if declaration:
+                replaying = False
+
+            client.execute_cell(cell, index)
+            executed += 1
+            if not declaration or any(o.output_type == 'error' for o in cell.outputs):
+                continue
+
+            # Dossier propre au worker : deux notebooks au même préfixe produisent la même clé
+            staging_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.rmtree(staging_path, ignore_errors=True)
+            staging_path.mkdir(parents=True)
+            try:
+                run_helper(_cell_cache_save_code(declaration, staging_path), index)
+                with open(staging_path / "outputs.json", 'w', encoding='utf-8') as f:
+                    json.dump(cell.outputs, f)
+                shutil.rmtree(entry_path, ignore_errors=True)
+                staging_path.rename(entry_path)
+            except Exception as e:
+                print(f"AVERTISSEMENT: Mise en cache impossible pour la cellule {index}. Erreur: {e}", file=sys.stderr)
+                shutil.rmtree(staging_path, ignore_errors=True)
+
+    nbformat.write(nb, notebook_path)
+    return restored, executed
+
+
+def process_notebook(notebook_path_str, cell_cache=False):
+    """Modifie, exécute, et déplace un notebook du répertoire racine vers le dossier de publication.
+
+    Avec cell_cache=True, l'exécution passe par execute_with_cell_cache() au lieu de nbconvert.
+    Renvoie True si le notebook a été exécuté et publié.
+    """
     notebook_path = Path(notebook_path_str)
 
     # Définir les chemins de destination dans `published/notebooks`
@@ -248,10 +751,13 @@ def process_notebook(notebook_path_str):
     dest_html_path = dest_notebook_path.with_suffix('.html')
 
     # --- VÉRIFICATION D'EXISTENCE ---
-    if dest_png_path.exists():
+    # Avec le cache de cellules, un notebook déjà publié puis modifié est réexécuté : c'est le cas que le cache accélère.
+    if dest_png_path.exists() and not cell_cache:
         print(f"AVERTISSEMENT: L'image {dest_png_path.name} existe déjà dans la destination.")
         print(f"Le notebook '{notebook_path.name}' n'a pas été traité. Veuillez le renommer ou le supprimer.")
-        return
+        return False
+    if dest_png_path.exists():
+        print(f"--> '{notebook_path.name}' est déjà publié : ses sorties dans '{PUBLISHED_NOTEBOOK_FOLDER}' seront écrasées.")
 
     print("-" * 50)
     print(f"Traitement du notebook : {notebook_path.name}")
@@ -263,19 +769,40 @@ def process_notebook(notebook_path_str):
         nb_content = json.load(f)
 
     # La cellule d'exportation pointera directement vers la destination finale
-    nb_content['cells'].append(create_export_cell(str(dest_png_path), str(dest_html_path)))
+    notebook_options = nb_content.get('metadata', {}).get(NOTEBOOK_METADATA_KEY, {})
+    optimize_export = notebook_options.get('optimize_export', True)
+    if not optimize_export:
+        print("--> Optimisation de l'export désactivée par les métadonnées du notebook.")
+    # Un notebook repris depuis published/ contient déjà une cellule d'export : on la remplace
+    nb_content['cells'] = [cell for cell in nb_content['cells'] if not _is_export_cell(cell)]
+    nb_content['cells'].append(create_export_cell(str(dest_png_path), str(dest_html_path), optimize_export,
+                                                  topojson=notebook_options.get('topojson', False)))
 
     with open(temp_notebook_path, 'w', encoding='utf-8') as f:
         json.dump(nb_content, f)
 
     try:
         print(f"Lancement de l'exécution de {temp_notebook_path.name}...")
-        subprocess.run(
-            [sys.executable, '-m', 'jupyter', 'nbconvert', '--execute',
-             '--to', 'notebook', '--inplace', str(temp_notebook_path), '--allow-errors'],
-            check=True, capture_output=True, text=True, encoding='utf-8')
+        if cell_cache:
+            execute_with_cell_cache(temp_notebook_path)
+        else:
+            subprocess.run(
+                [sys.executable, '-m', 'jupyter', 'nbconvert', '--execute',
+                 '--to', 'notebook', '--inplace', str(temp_notebook_path), '--allow-errors'],
+                check=True, capture_output=True, text=True, encoding='utf-8')
         print("Exécution terminée.")
 
+        # Résumé des optimisations appliquées par la cellule d'export
+        export_report_path = Path(f"{dest_html_path}.export_report.json")
+        if export_report_path.exists():
+            try:
+                with open(export_report_path, 'r', encoding='utf-8') as f:
+                    for message in json.load(f):
+                        print(f"--> Export optimisé : {message}")
+            except (IOError, json.JSONDecodeError):
+                pass
+            export_report_path.unlink()
+
         # POST-TRAITEMENT : capture d'écran pour les HTML qui le requièrent
         if dest_html_path.exists():
             screenshot_marker_path = Path(f"{dest_html_path}.needs_screenshot")
@@ -301,6 +828,7 @@ def process_notebook(notebook_path_str):
         shutil.move(str(temp_notebook_path), str(dest_notebook_path))
         notebook_path.unlink()
         print(f"Le notebook '{notebook_path.name}' a été traité et déplacé vers '{dest_notebook_path}'.")
+        return True
 
     except subprocess.CalledProcessError as e:
         print(f"ERREUR lors de l'exécution de {notebook_path.name}.", file=sys.stderr)
@@ -309,12 +837,134 @@ def process_notebook(notebook_path_str):
         print("--- STDERR ---", file=sys.stderr)
         print(e.stderr, file=sys.stderr)
         print(f"Le notebook original '{notebook_path.name}' a été laissé dans le répertoire racine pour inspection.", file=sys.stderr)
+        return False
+    except NotebookExecutionError as e:
+        print(f"ERREUR lors de l'exécution de {notebook_path.name}.", file=sys.stderr)
+        print("--- ERREUR D'EXÉCUTION ---", file=sys.stderr)
+        print(e, file=sys.stderr)
+        print(f"Le notebook original '{notebook_path.name}' a été laissé dans le répertoire racine pour inspection.", file=sys.stderr)
+        return False
     finally:
         # Nettoie le fichier temporaire uniquement s'il existe encore (en cas d'échec)
         temp_notebook_path.unlink(missing_ok=True)
 
 
+def find_dataset_urls(notebook_path):
+    """Renvoie les URL passées à load_file_from_url_lite() dans les cellules de code d'un notebook."""
+    try:
+        with open(notebook_path, 'r', encoding='utf-8') as f:
+            cells = json.load(f).get('cells', [])
+    except (IOError, json.JSONDecodeError):
+        return set()
+    urls = set()
+    for cell in cells:
+        if cell.get('cell_type') == 'code':
+            source = ''.join(cell.get('source', []))
+            urls.update(re.findall(r'load_file_from_url_lite\(\s*(?:url_dataset\s*=\s*)?["\']([^"\']+)["\']', source))
+    return urls
+
+
+def load_runtime_history():
+    try:
+        with open(RUNTIME_HISTORY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return {}
+
+
+def predict_runtime(notebook_name, dataset_urls, history):
+    """Estime la durée d'un notebook : son historique, sinon celui des notebooks du même dataset, sinon la médiane."""
+    if notebook_name in history:
+        return history[notebook_name]["seconds"]
+    same_dataset = [entry["seconds"] for entry in history.values() if dataset_urls & set(entry.get("datasets", []))]
+    if same_dataset:
+        return statistics.mean(same_dataset)
+    if history:
+        return statistics.median(entry["seconds"] for entry in history.values())
+    return DEFAULT_NOTEBOOK_RUNTIME
+
+
+def schedule_batch(notebooks, workers, history):
+    """Répartit les notebooks entre workers : groupes par dataset, puis plus long d'abord (LPT).
+
+    Les notebooks qui chargent une même URL (directement ou de proche en proche) forment un groupe
+    exécuté par un seul worker, pour profiter des caches chauds. Les groupes sont affectés du plus
+    long au plus court au worker le moins chargé. Renvoie (files par worker, makespan prévu).
+    """
+    groups = []  # [(urls, [(notebook, urls, durée prévue), ...])]
+    for notebook in notebooks:
+        urls = find_dataset_urls(notebook)
+        job = (notebook, urls, predict_runtime(notebook.name, urls, history))
+        merged_urls, merged_jobs = set(urls), [job]
+        for group in [g for g in groups if g[0] & urls]:
+            groups.remove(group)
+            merged_urls |= group[0]
+            merged_jobs.extend(group[1])
+        groups.append((merged_urls, merged_jobs))
+
+    groups.sort(key=lambda g: sum(job[2] for job in g[1]), reverse=True)
+    loads = [(0.0, worker) for worker in range(workers)]
+    queues = [[] for _ in range(workers)]
+    for _, jobs in groups:
+        load, worker = heapq.heappop(loads)
+        queues[worker].extend(sorted(jobs, key=lambda job: job[2], reverse=True))
+        heapq.heappush(loads, (load + sum(job[2] for job in jobs), worker))
+    return queues, max(load for load, _ in loads)
+
+
+def run_batch(notebooks, workers=BATCH_WORKERS, cell_cache=False):
+    """Exécute un lot de notebooks selon schedule_batch() et compare le makespan prévu au makespan réel."""
+    history = load_runtime_history()
+    queues, predicted_makespan = schedule_batch(notebooks, workers, history)
+    print(f"Planification sur {workers} worker(s), makespan prévu : {predicted_makespan:.0f}s.")
+    for worker, queue in enumerate(queues):
+        if queue:
+            print(f"  Worker {worker} ({sum(job[2] for job in queue):.0f}s prévues) : "
+                  + ", ".join(f"{job[0].name} (~{job[2]:.0f}s)" for job in queue))
+
+    def run_queue(queue):
+        # Durée de chaque job, publié ou non ; seuls les notebooks publiés alimentent l'historique.
+        timings = []
+        for notebook, urls, _ in queue:
+            start = time.perf_counter()
+            try:
+                processed = process_notebook(str(notebook), cell_cache=cell_cache)
+            except Exception as e:
+                print(f"ERREUR inattendue lors du traitement de {notebook.name} : {e}", file=sys.stderr)
+                processed = False
+            timings.append((notebook.name, time.perf_counter() - start, sorted(urls), processed))
+        return timings
+
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        worker_timings = list(pool.map(run_queue, queues))
+    actual_makespan = time.perf_counter() - batch_start
+
+    print("-" * 50)
+    for worker, (queue, timings) in enumerate(zip(queues, worker_timings)):
+        if queue:
+            failed = sum(not processed for *_, processed in timings)
+            print(f"  Worker {worker} : prévu {sum(job[2] for job in queue):.0f}s, "
+                  f"réel {sum(seconds for _, seconds, _, _ in timings):.0f}s"
+                  + (f" (dont {failed} notebook(s) non publié(s))." if failed else "."))
+    print(f"Makespan prévu : {predicted_makespan:.0f}s, réel : {actual_makespan:.0f}s.")
+
+    for timings in worker_timings:
+        for name, seconds, urls, processed in timings:
+            if processed:
+                history[name] = {"seconds": seconds, "datasets": urls}
+    with open(RUNTIME_HISTORY_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exécute les notebooks de notebooks/ et publie leurs visualisations.")
+    parser.add_argument("--cell-cache", action="store_true",
+                        help="Réutilise les sorties des cellules inchangées (voir CELL_CACHE_FOLDER).")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help="Nombre de notebooks exécutés en parallèle.")
+    args = parser.parse_args()
+
     # S'assurer que le dossier de publication existe
     PUBLISHED_NOTEBOOK_FOLDER.mkdir(parents=True, exist_ok=True)
 
@@ -326,8 +976,17 @@ if __name__ == "__main__":
         print("Aucun notebook .ipynb trouvé à la racine du projet pour le traitement.")
     else:
         print(f"Trouvé {len(notebooks_to_run)} notebook(s) à traiter...")
-        for notebook in notebooks_to_run:
-            process_notebook(str(notebook))
+        # Un seul serveur d'export pour tout le batch : Chromium ne démarre qu'une fois.
+        export_server = ExportServer()
+        try:
+            export_server.start()
+        except ExportServerError as e:
+            print(f"AVERTISSEMENT: {e}", file=sys.stderr)
+            print("--> Chaque noyau utilisera kaleido directement.", file=sys.stderr)
+        try:
+            run_batch(notebooks_to_run, workers=max(1, args.workers), cell_cache=args.cell_cache)
+        finally:
+            export_server.stop()
     
     print("-" * 50)
     print("Batch terminé.")